@@ -1,333 +1,922 @@
-import streamlit as st
-import google.generativeai as genai
-from datetime import datetime
-
-# Page config
-st.set_page_config(page_title="Mental Health Companion", page_icon="🧠")
-
-# Get API key and configure
-try:
-    GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
-    genai.configure(api_key=GEMINI_API_KEY)
-    
-    # Try different model names until one works
-    model = None
-    model_options = [
-        'gemini-1.5-flash-latest',
-        'gemini-1.5-flash',
-        'gemini-1.5-pro-latest',
-        'gemini-pro'
-    ]
-    
-    for model_name in model_options:
-        try:
-            model = genai.GenerativeModel(model_name)
-            # Test if it works
-            test = model.generate_content("Hello")
-            st.sidebar.success(f"✅ Using model: {model_name}")
-            break
-        except:
-            continue
-    
-    if model is None:
-        st.error("⚠️ Could not load any Gemini model. Please check your API key.")
-        st.stop()
-        
-except Exception as e:
-    st.error("⚠️ API key not configured. Please add your Gemini API key in Streamlit secrets.")
-    st.stop()
-
-# App title
-st.title("🧠 Mental Health Companion")
-st.write("Your free, private space for reflective journaling")
-
-# Initialize session state
-if 'entries' not in st.session_state:
-    st.session_state.entries = []
-
-# Sidebar navigation
-page = st.sidebar.selectbox(
-    "Navigate",
-    ["📝 Journal Entry", "💡 Get Prompt", "📊 Therapy Prep", "📖 View History"]
-)
-
-# Helper function for emotion detection
-def detect_emotion_with_gemini(text):
-    prompt = f"""Analyze the emotion in this journal entry. Respond with ONLY one word from this list: joy, sadness, anger, fear, surprise, neutral
-
-Journal entry: {text}
-
-Emotion:"""
-    
-    try:
-        response = model.generate_content(prompt)
-        emotion = response.text.strip().lower()
-        # Validate emotion
-        valid_emotions = ['joy', 'sadness', 'anger', 'fear', 'surprise', 'neutral']
-        if emotion not in valid_emotions:
-            emotion = 'neutral'
-        confidence = 0.85  # Default confidence
-        return emotion, confidence
-    except Exception as e:
-        st.error(f"Emotion detection error: {str(e)}")
-        return "neutral", 0.5
-
-# PAGE 1: Journal Entry
-if page == "📝 Journal Entry":
-    st.header("Write Your Thoughts")
-    st.write("This is a safe, private space. Write freely about what's on your mind.")
-    
-    user_entry = st.text_area(
-        "What's on your mind?",
-        height=200,
-        placeholder="Take your time... express whatever you're feeling..."
-    )
-    
-    col1, col2 = st.columns([1, 3])
-    
-    with col1:
-        if st.button("💾 Save Entry", type="primary"):
-            if user_entry.strip():
-                with st.spinner("🔍 Analyzing your entry..."):
-                    try:
-                        # Detect emotion using Gemini
-                        emotion, confidence = detect_emotion_with_gemini(user_entry)
-                        
-                        # Save entry
-                        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        entry_data = {
-                            'timestamp': timestamp,
-                            'text': user_entry,
-                            'emotion': emotion,
-                            'confidence': confidence
-                        }
-                        st.session_state.entries.append(entry_data)
-                        
-                        # Success message
-                        st.success("✅ Entry saved!")
-                        
-                        # Show emotion
-                        st.info(f"**Detected emotion:** {emotion.capitalize()}")
-                        st.progress(confidence)
-                        st.caption(f"Confidence: {confidence:.1%}")
-                        
-                        # Get supportive response from Gemini
-                        support_prompt = f"""You are a compassionate mental health companion. The user just journaled about their feelings (emotion: {emotion}).
-Provide a brief, warm, supportive response (2-3 sentences maximum). Be validating and encouraging.
-
-User's entry: {user_entry[:300]}"""
-                        
-                        try:
-                            support_response = model.generate_content(support_prompt)
-                            st.write("💙 **Response:**")
-                            st.write(support_response.text)
-                        except:
-                            # Fallback supportive messages
-                            supportive_messages = {
-                                'joy': "💛 It's wonderful to see you feeling positive!",
-                                'sadness': "💙 Thank you for sharing. It's okay to feel this way.",
-                                'anger': "❤️ Your feelings are valid. Take time to process them.",
-                                'fear': "💜 It's brave of you to acknowledge these feelings.",
-                                'surprise': "💚 Life can be unexpected. You're handling it well.",
-                                'neutral': "💙 Thank you for taking time to journal today."
-                            }
-                            message = supportive_messages.get(emotion, "💙 Thank you for sharing.")
-                            st.write(message)
-                    
-                    except Exception as e:
-                        st.error(f"An error occurred: {str(e)}")
-                        
-            else:
-                st.warning("⚠️ Please write something first")
-
-# PAGE 2: Get Journaling Prompt
-elif page == "💡 Get Prompt":
-    st.header("Get a Journaling Prompt")
-    st.write("Need inspiration? Generate a thoughtful prompt to guide your journaling.")
-    
-    topic = st.selectbox(
-        "Choose a focus area:",
-        ["General Reflection", "Stress & Anxiety", "Gratitude", 
-         "Self-Compassion", "Relationships", "Personal Growth", "Emotions"]
-    )
-    
-    if st.button("✨ Generate Prompt", type="primary"):
-        with st.spinner("🤔 Creating your prompt..."):
-            try:
-                prompt_request = f"""Create a thoughtful, open-ended journaling prompt about {topic.lower()}.
-Make it compassionate, encouraging self-reflection. Keep it 2-3 sentences. Be specific and actionable."""
-                
-                response = model.generate_content(prompt_request)
-                prompt_text = response.text
-                
-                st.write("### 💭 Your Journaling Prompt:")
-                st.info(prompt_text)
-                
-                st.write("---")
-                st.write("**Ready to write?** Use the space below:")
-                
-                quick_entry = st.text_area("Your response:", height=150, key="quick_journal")
-                
-                if st.button("Save This Entry"):
-                    if quick_entry.strip():
-                        with st.spinner("Analyzing..."):
-                            emotion, confidence = detect_emotion_with_gemini(quick_entry)
-                            
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            entry_data = {
-                                'timestamp': timestamp,
-                                'text': f"Prompt: {prompt_text}\n\nResponse: {quick_entry}",
-                                'emotion': emotion,
-                                'confidence': confidence
-                            }
-                            st.session_state.entries.append(entry_data)
-                            st.success("✅ Entry saved!")
-            
-            except Exception as e:
-                # Fallback prompts
-                fallback_prompts = {
-                    "General Reflection": "What were three moments today that made you feel something? Describe each moment and the emotion it brought up.",
-                    "Stress & Anxiety": "What's weighing on your mind right now? Write about one thing you're worried about and one small step you could take to address it.",
-                    "Gratitude": "List five small things from today that you're grateful for. Why did each one matter to you?",
-                    "Self-Compassion": "If your best friend was going through what you're experiencing, what would you say to them? Now, say those words to yourself.",
-                    "Relationships": "Think of someone who matters to you. What do you appreciate about them? When did you last tell them?",
-                    "Personal Growth": "What's one thing you'd like to improve about yourself? What's one small action you could take this week?",
-                    "Emotions": "What emotion have you been feeling most lately? Where do you feel it in your body? What might it be trying to tell you?"
-                }
-                st.write("### 💭 Your Journaling Prompt:")
-                st.info(fallback_prompts[topic])
-
-# PAGE 3: Therapy Prep
-elif page == "📊 Therapy Prep":
-    st.header("Therapy Session Preparation")
-    st.write("Review your journal entries and identify patterns to discuss in therapy.")
-    
-    if len(st.session_state.entries) == 0:
-        st.info("📝 No journal entries yet. Start journaling to generate insights for therapy!")
-    else:
-        st.write(f"**Total entries:** {len(st.session_state.entries)}")
-        
-        # Emotion distribution
-        st.write("### 📊 Your Emotional Patterns")
-        emotions = [entry['emotion'] for entry in st.session_state.entries]
-        emotion_counts = {}
-        for emotion in emotions:
-            emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
-        
-        # Display as a simple chart
-        for emotion, count in sorted(emotion_counts.items(), key=lambda x: x[1], reverse=True):
-            percentage = (count / len(emotions)) * 100
-            st.write(f"**{emotion.capitalize()}**: {count} entries ({percentage:.1f}%)")
-            st.progress(percentage / 100)
-        
-        st.write("---")
-        
-        # AI-generated therapy prep
-        st.write("### 🤖 AI-Generated Therapy Prep Summary")
-        
-        if st.button("Generate Therapy Summary", type="primary"):
-            with st.spinner("📊 Analyzing your journal entries..."):
-                try:
-                    # Compile recent entries
-                    recent_entries = st.session_state.entries[-10:]
-                    entries_text = "\n\n".join([
-                        f"[{e['timestamp']}] Emotion: {e['emotion']}\n{e['text'][:400]}"
-                        for e in recent_entries
-                    ])
-                    
-                    summary_prompt = f"""You are a mental health assistant helping prepare for therapy.
-
-Based on these journal entries, create a concise summary with:
-1. Key emotional themes (3-5 bullet points)
-2. Suggested discussion topics for therapy (3-4 topics)
-3. Questions to explore with therapist (2-3 questions)
-
-Keep it professional, concise, and actionable.
-
-Recent journal entries:
-{entries_text}"""
-                    
-                    response = model.generate_content(summary_prompt)
-                    
-                    st.write(response.text)
-                    
-                    # Export option
-                    st.write("---")
-                    full_summary = f"""THERAPY SESSION PREP SUMMARY
-Generated: {datetime.now().strftime("%Y-%m-%d")}
-
-{response.text}
-
-EMOTIONAL DISTRIBUTION:
-"""
-                    for emotion, count in sorted(emotion_counts.items(), key=lambda x: x[1], reverse=True):
-                        percentage = (count / len(emotions)) * 100
-                        full_summary += f"- {emotion.capitalize()}: {count} entries ({percentage:.1f}%)\n"
-                    
-                    st.download_button(
-                        "📄 Download Summary",
-                        data=full_summary,
-                        file_name=f"therapy_prep_{datetime.now().strftime('%Y%m%d')}.txt",
-                        mime="text/plain"
-                    )
-                
-                except Exception as e:
-                    st.error(f"Error generating summary: {str(e)}")
-
-# PAGE 4: View History
-elif page == "📖 View History":
-    st.header("Your Journal History")
-    
-    if len(st.session_state.entries) == 0:
-        st.info("📝 No entries yet. Start journaling to see your history here!")
-    else:
-        st.write(f"**Total entries:** {len(st.session_state.entries)}")
-        
-        # Filter by emotion
-        all_emotions = list(set([e['emotion'] for e in st.session_state.entries]))
-        filter_emotion = st.selectbox("Filter by emotion:", ["All"] + all_emotions)
-        
-        # Display entries
-        filtered_entries = st.session_state.entries
-        if filter_emotion != "All":
-            filtered_entries = [e for e in st.session_state.entries if e['emotion'] == filter_emotion]
-        
-        st.write(f"Showing {len(filtered_entries)} entries")
-        
-        for i, entry in enumerate(reversed(filtered_entries)):
-            with st.expander(f"📅 {entry['timestamp']} - {entry['emotion'].capitalize()}"):
-                st.write(entry['text'])
-                st.caption(f"Confidence: {entry['confidence']:.1%}")
-        
-        # Export all
-        st.write("---")
-        if st.button("📥 Export All Entries"):
-            export_text = ""
-            for entry in st.session_state.entries:
-                export_text += f"\n{'='*60}\n"
-                export_text += f"Date: {entry['timestamp']}\n"
-                export_text += f"Emotion: {entry['emotion']} (confidence: {entry['confidence']:.1%})\n"
-                export_text += f"\n{entry['text']}\n"
-            
-            st.download_button(
-                "💾 Download Complete Journal",
-                data=export_text,
-                file_name=f"complete_journal_{datetime.now().strftime('%Y%m%d')}.txt",
-                mime="text/plain"
-            )
-
-# Sidebar info
-st.sidebar.write("---")
-st.sidebar.write("### 💙 About This App")
-st.sidebar.info("""
-This is a free mental health companion powered by Google Gemini AI.
-
-**Features:**
-- AI emotion detection
-- Personalized journaling prompts
-- Therapy session preparation
-- Secure and private
-""")
-st.sidebar.write(f"**Your entries:** {len(st.session_state.entries)}")
-
-
+import asyncio
+import json
+import math
+import random
+import re
+import sqlite3
+import threading
+from typing import Final
+from collections import Counter
+
+import streamlit as st
+import google.generativeai as genai
+from datetime import datetime
+
+# Page config
+st.set_page_config(page_title="Mental Health Companion", page_icon="🧠")
+
+# Local emotion model (optional fast path)
+EMOTION_MODEL_ID = "j-hartmann/emotion-english-distilroberta-base"
+QUANTIZED_MODEL_DIR = "emotion-model-int8"
+
+
+@st.cache_resource(show_spinner=False)
+def load_local_emotion_detector():
+    """Load an INT8-quantized ONNX copy of the emotion classifier.
+
+    The model is exported and quantized (dynamic, per-channel) on first run
+    and the artifact is reused from disk afterwards. Returns a callable
+    `text -> {'label', 'score'}`, or None when the optional dependencies
+    (optimum, onnxruntime, transformers) are not installed — callers fall
+    back to Gemini in that case.
+    """
+    try:
+        import os
+
+        import numpy as np
+        import onnxruntime as ort
+        from optimum.onnxruntime import (
+            ORTModelForSequenceClassification,
+            ORTQuantizer,
+        )
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+    except ImportError:
+        return None
+
+    try:
+        if not os.path.isdir(QUANTIZED_MODEL_DIR):
+            exported = ORTModelForSequenceClassification.from_pretrained(
+                EMOTION_MODEL_ID, export=True
+            )
+            quantizer = ORTQuantizer.from_pretrained(exported)
+            quantizer.quantize(
+                save_dir=QUANTIZED_MODEL_DIR,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(
+                    is_static=False, per_channel=True
+                ),
+            )
+            # Keep the tokenizer with the quantized weights so warm starts
+            # never touch the hub
+            AutoTokenizer.from_pretrained(EMOTION_MODEL_ID).save_pretrained(
+                QUANTIZED_MODEL_DIR
+            )
+
+        # Full graph optimization (kernel fusion etc.) and all cores for
+        # the single forward pass
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        session_options.intra_op_num_threads = os.cpu_count() or 1
+
+        model = ORTModelForSequenceClassification.from_pretrained(
+            QUANTIZED_MODEL_DIR, session_options=session_options
+        )
+        tokenizer = AutoTokenizer.from_pretrained(QUANTIZED_MODEL_DIR)
+    except Exception:
+        return None
+
+    def classify(text):
+        # Accepts a single string or a batch of strings
+        texts = [text] if isinstance(text, str) else list(text)
+        # Attention is O(L^2); 256 tokens keeps the label while quartering
+        # the FLOPs of a full 512-token pass
+        inputs = tokenizer(
+            texts, return_tensors="np", truncation=True, max_length=256, padding=True
+        )
+        logits = model(**inputs).logits
+        probs = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        probs /= probs.sum(axis=-1, keepdims=True)
+        results = []
+        for row in probs:
+            best = int(row.argmax())
+            results.append({
+                'label': model.config.id2label[best].lower(),
+                'score': float(row[best]),
+            })
+        return results[0] if isinstance(text, str) else results
+
+    return classify
+
+MODEL_NAME_CACHE_FILE = ".gemini_model_name"
+
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_model():
+    """Resolve a working Gemini model once per container.
+
+    Each probe costs a full network round trip, so API-key configuration
+    and the discovery loop are cached for the process lifetime, and the
+    last working model name is persisted to a small local file — warm
+    restarts try it first and skip the probe entirely. Returns
+    (model_name, model); raises RuntimeError when the key is missing or
+    no candidate works. Only successes are cached — st.cache_resource
+    does not memoize exceptions, so a transient failure is probed again
+    on the next rerun instead of sticking for the container's lifetime.
+    """
+    try:
+        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+    except Exception:
+        raise RuntimeError(
+            "API key not configured. Please add your Gemini API key in Streamlit secrets."
+        )
+
+    model_options = [
+        'gemini-1.5-flash-latest',
+        'gemini-1.5-flash',
+        'gemini-1.5-pro-latest',
+        'gemini-pro'
+    ]
+
+    try:
+        with open(MODEL_NAME_CACHE_FILE) as f:
+            cached_name = f.read().strip()
+        if cached_name:
+            model_options = [cached_name] + [m for m in model_options if m != cached_name]
+    except OSError:
+        pass
+
+    for model_name in model_options:
+        try:
+            candidate = genai.GenerativeModel(model_name)
+            # Test if it works; one output token keeps the probe cheap
+            candidate.generate_content(
+                "Hello", generation_config={'max_output_tokens': 1}
+            )
+        except Exception:
+            continue
+        try:
+            with open(MODEL_NAME_CACHE_FILE, 'w') as f:
+                f.write(model_name)
+        except OSError:
+            pass
+        return model_name, candidate
+
+    raise RuntimeError("Could not load any Gemini model. Please check your API key.")
+
+
+def require_gemini():
+    """Resolve the cached Gemini model on first actual use.
+
+    Pages that never talk to Gemini (e.g. View History) skip the model
+    probe entirely; st.cache_resource keeps it to one probe per container
+    for the pages that do. Shows the failure and halts the script when no
+    model is available.
+    """
+    try:
+        return get_gemini_model()
+    except RuntimeError as e:
+        st.error(f"⚠️ {e}")
+        st.stop()
+
+
+def _warm_gemini() -> None:
+    """Run the model probe off the main thread at session start.
+
+    The first generate_content call of a fresh container pays the TLS
+    handshake and HTTP/2 session setup on top of the model probe itself.
+    Doing it here overlaps that cost with the user reading the page, so
+    the first Save hits an already-resolved model over a warm
+    connection. Errors are swallowed and stay uncached — there is no
+    ScriptRunContext here to report to, and require_gemini re-probes and
+    reports at the point of actual use.
+    """
+    try:
+        get_gemini_model()
+    except Exception:
+        pass
+
+# App title
+st.title("🧠 Mental Health Companion")
+st.write("Your free, private space for reflective journaling")
+
+DB_FILE = "journal.db"
+
+
+@st.cache_resource(show_spinner=False)
+def get_db():
+    """Open (and initialize) the journal database once per container."""
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    # WAL keeps saves from blocking concurrent reads
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS entries "
+        "(ts TEXT, text TEXT, emotion TEXT, confidence REAL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_emotion ON entries(emotion)")
+    conn.commit()
+    return conn
+
+# Entries are stored column-wise (struct-of-arrays): scans over a single
+# field walk one contiguous list instead of chasing a dict per entry.
+# Only a bounded window of recent entries is kept in memory; the full
+# journal lives in SQLite.
+ENTRY_COLUMNS: Final = ('timestamp', 'text', 'emotion', 'confidence')
+MAX_SESSION_ENTRIES: Final = 200
+
+def entry_count():
+    """Entries in the in-memory window (capped at MAX_SESSION_ENTRIES)."""
+    return len(st.session_state.entries['timestamp'])
+
+def total_entries():
+    """Total persisted entries, which may exceed the in-memory window."""
+    if entry_count() == 0:
+        return 0
+    return sum(emotion_stats(
+        entry_count(), st.session_state.entries['timestamp'][-1]
+    ).values())
+
+def add_entry(entry_data):
+    """Persist an entry and keep the in-session columns in sync."""
+    conn = get_db()
+    conn.execute(
+        "INSERT INTO entries VALUES (?, ?, ?, ?)",
+        (entry_data['timestamp'], entry_data['text'],
+         entry_data['emotion'], entry_data['confidence'])
+    )
+    conn.commit()
+    for col, value in entry_data.items():
+        st.session_state.entries[col].append(value)
+    # Oldest entries fall out of the window; they remain in the database
+    if entry_count() > MAX_SESSION_ENTRIES:
+        for col in ENTRY_COLUMNS:
+            del st.session_state.entries[col][0]
+
+@st.cache_data(ttl=60, show_spinner=False)
+def today_str(fmt):
+    """Current date formatted once per minute; repeated reruns skip the
+    strftime locale machinery."""
+    return datetime.now().strftime(fmt)
+
+@st.cache_data(show_spinner=False)
+def emotion_stats(count, last_ts):
+    """Emotion distribution over all entries.
+
+    count and last_ts only serve as the cache key: a rerun where nothing
+    was saved reuses the memoized Counter and skips even the SQL
+    aggregate. Bulk re-analysis clears this cache explicitly since it
+    changes emotions without changing either key.
+    """
+    return Counter(dict(get_db().execute(
+        "SELECT emotion, COUNT(*) FROM entries GROUP BY emotion"
+    )))
+
+# Initialize session state from the database, so entries survive
+# restarts; only the most recent window is pulled into memory
+if 'entries' not in st.session_state:
+    rows = get_db().execute(
+        "SELECT ts, text, emotion, confidence FROM entries ORDER BY ts DESC LIMIT ?",
+        (MAX_SESSION_ENTRIES,)
+    ).fetchall()[::-1]
+    st.session_state.entries = {
+        col: [row[i] for row in rows] for i, col in enumerate(ENTRY_COLUMNS)
+    }
+
+# Fire-and-forget connection warm-up; once per session is enough since
+# st.cache_resource keeps the resolved model for the whole container
+if 'gemini_warmed' not in st.session_state:
+    st.session_state.gemini_warmed = True
+    threading.Thread(target=_warm_gemini, daemon=True).start()
+
+# Sidebar navigation
+page = st.sidebar.selectbox(
+    "Navigate",
+    ["📝 Journal Entry", "💡 Get Prompt", "📊 Therapy Prep", "📖 View History"]
+)
+
+# Longest slice of an entry sent to Gemini for analysis; caps prefill
+# tokens (and latency) on very long entries
+ANALYSIS_CHAR_LIMIT: Final = 1200
+
+VALID_EMOTIONS: Final = frozenset({'joy', 'sadness', 'anger', 'fear', 'surprise', 'neutral'})
+
+def _normalize_emotion(raw):
+    """Normalize a model-produced label ('Joy!', 'sadness.') to the
+    canonical set; anything unrecognized maps to neutral."""
+    emotion = raw.strip().lower().rstrip('.!?,;:')
+    return emotion if emotion in VALID_EMOTIONS else 'neutral'
+
+# Prompt templates, parsed once at import; handlers substitute with
+# format_map instead of rebuilding multi-line f-strings per call
+EMOTION_TMPL: Final = """Analyze the emotion in this journal entry. Respond with ONLY one word from this list: joy, sadness, anger, fear, surprise, neutral
+
+Journal entry: {text}
+
+Emotion:"""
+
+SUPPORT_TMPL: Final = """You are a compassionate mental health companion. The user just journaled about their feelings.
+Provide a brief, warm, supportive response (2-3 sentences maximum). Be validating and encouraging.
+
+User's entry: {text}"""
+
+ANALYZE_TMPL: Final = """Analyze this journal entry and respond with ONLY a JSON object, no code fences:
+{{"emotion": "<one of: joy, sadness, anger, fear, surprise, neutral>", "response": "<a warm, validating, supportive reply of 2-3 sentences>"}}
+
+Journal entry: {text}"""
+
+PROMPT_REQUEST_TMPL: Final = """Create a thoughtful, open-ended journaling prompt about {topic}.
+Make it compassionate, encouraging self-reflection. Keep it 2-3 sentences. Be specific and actionable. Variation seed: {seed}."""
+
+SUMMARY_TMPL: Final = """You are a mental health assistant helping prepare for therapy.
+
+The input below is a JSON list of journal entries; each has "t" (timestamp), "e" (detected emotion) and "x" (entry text).
+
+Based on these journal entries, create a concise summary with:
+1. Key emotional themes (3-5 bullet points)
+2. Suggested discussion topics for therapy (3-4 topics)
+3. Questions to explore with therapist (2-3 questions)
+
+Keep it professional, concise, and actionable.
+
+Recent journal entries:
+{entries}"""
+
+# Static response and prompt banks, built once per container rather than
+# on every script rerun
+SUPPORTIVE_MESSAGES: Final = {
+    'joy': "💛 It's wonderful to see you feeling positive!",
+    'sadness': "💙 Thank you for sharing. It's okay to feel this way.",
+    'anger': "❤️ Your feelings are valid. Take time to process them.",
+    'fear': "💜 It's brave of you to acknowledge these feelings.",
+    'surprise': "💚 Life can be unexpected. You're handling it well.",
+    'neutral': "💙 Thank you for taking time to journal today."
+}
+
+PROMPT_VARIANTS: Final = {
+    "General Reflection": [
+        "What were three moments today that made you feel something? Describe each moment and the emotion it brought up.",
+        "If today had a title like a book chapter, what would it be? Write about why.",
+        "What surprised you today, even in a small way? How did you react to it?",
+        "Describe your day as if you were telling a close friend. What would you emphasize?"
+    ],
+    "Stress & Anxiety": [
+        "What's weighing on your mind right now? Write about one thing you're worried about and one small step you could take to address it.",
+        "When did you last feel truly calm? What was different about that moment?",
+        "Write down your biggest worry, then ask: what's the most likely outcome, really?",
+        "What's one thing within your control today, and one thing you could let go of?"
+    ],
+    "Gratitude": [
+        "List five small things from today that you're grateful for. Why did each one matter to you?",
+        "Who made your life a little easier recently? What did they do?",
+        "What's something ordinary you'd miss if it were gone tomorrow?",
+        "Describe a place that makes you feel at ease. What do you appreciate about it?"
+    ],
+    "Self-Compassion": [
+        "If your best friend was going through what you're experiencing, what would you say to them? Now, say those words to yourself.",
+        "What's one mistake you've been holding onto? What would forgiving yourself look like?",
+        "Write a short letter to yourself from five years ago. What do they need to hear?",
+        "What did you do today that was enough, even if it wasn't everything?"
+    ],
+    "Relationships": [
+        "Think of someone who matters to you. What do you appreciate about them? When did you last tell them?",
+        "What's a conversation you've been avoiding? What makes it hard to start?",
+        "Describe a moment when you felt truly understood. Who were you with?",
+        "What do you need more of from the people around you? Have you asked for it?"
+    ],
+    "Personal Growth": [
+        "What's one thing you'd like to improve about yourself? What's one small action you could take this week?",
+        "What's a belief about yourself you've outgrown? What replaced it?",
+        "When did you last do something for the first time? How did it feel?",
+        "What would you attempt if you knew it was okay to fail at it?"
+    ],
+    "Emotions": [
+        "What emotion have you been feeling most lately? Where do you feel it in your body? What might it be trying to tell you?",
+        "What's an emotion you find hard to sit with? What do you usually do when it shows up?",
+        "If your current mood were weather, what would the forecast be? Describe it.",
+        "What made you feel most alive this week? What dulled you?"
+    ]
+}
+
+# Lexicon pre-classifier: a single precompiled regex scan runs in
+# microseconds, against milliseconds for the local model and seconds for
+# a Gemini round trip, so every entry tries it first
+EMOTION_KEYWORDS = {
+    'joy': ['happy', 'excited', 'grateful', 'glad', 'joyful', 'proud',
+            'delighted', 'cheerful', 'wonderful'],
+    'sadness': ['sad', 'depressed', 'lonely', 'miserable', 'crying',
+                'cried', 'hopeless', 'heartbroken', 'grieving'],
+    'anger': ['angry', 'furious', 'annoyed', 'frustrated', 'mad',
+              'irritated', 'resentful', 'livid'],
+    'fear': ['afraid', 'scared', 'anxious', 'worried', 'nervous',
+             'terrified', 'panicking', 'dreading'],
+    'surprise': ['surprised', 'shocked', 'stunned', 'unexpected',
+                 'amazed', 'astonished'],
+}
+EMOTION_LEXICON: Final = {
+    keyword: emotion
+    for emotion, keywords in EMOTION_KEYWORDS.items()
+    for keyword in keywords
+}
+LEXICON_PATTERN: Final = re.compile(
+    r"\b(?:" + "|".join(map(re.escape, EMOTION_LEXICON)) + r")\b", re.IGNORECASE
+)
+
+def keyword_emotion(text):
+    """Classify an entry by lexicon scan alone when the signal is clear.
+
+    One pass of the combined pattern tallies hits per emotion. A clear
+    winner — at least two hits, leading the runner-up by two — short-
+    circuits with a confidence scaled by its share of the hits. Short
+    entries settle for a single uncontested hit, since a nine-word entry
+    containing "furious" rarely needs a model to confirm it. Returns
+    (emotion, confidence), or None to fall through to the model.
+    """
+    hits = Counter(
+        EMOTION_LEXICON[match.lower()] for match in LEXICON_PATTERN.findall(text)
+    )
+    if not hits:
+        return None
+    ranked = hits.most_common(2)
+    top_emotion, top = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0
+    if top >= 2 and top - runner_up >= 2:
+        return top_emotion, min(0.9, 0.6 + 0.3 * top / sum(hits.values()))
+    if runner_up == 0 and len(text.split()) < 15:
+        return top_emotion, 0.75
+    return None
+
+# Helper functions for emotion detection
+def _emotion_prompt(text):
+    return EMOTION_TMPL.format_map({'text': text[:ANALYSIS_CHAR_LIMIT]})
+
+def _gemini_emotion(text):
+    """Single Gemini classification round trip; raises on API failure."""
+    _, model = require_gemini()
+    response = model.generate_content(_emotion_prompt(text))
+    emotion = _normalize_emotion(response.text)
+    confidence = 0.85  # Default confidence
+    return emotion, confidence
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def _classify_entry(model_key, text):
+    """Classification core behind Streamlit's data cache; repeat saves of
+    the same text within the TTL are served from memory. model_key ties
+    cached results to the backing model, so switching models invalidates
+    old entries."""
+    classifier = load_local_emotion_detector()
+    if classifier is not None:
+        result = classifier(text)
+        return _normalize_emotion(result['label']), result['score']
+    return _gemini_emotion(text)
+
+def detect_emotion(text):
+    """Classify an entry locally when the quantized model is available,
+    otherwise fall back to Gemini.
+
+    Results are memoized per text, so re-saving an unchanged entry is a
+    dict lookup rather than another forward pass or API round trip.
+    Failures are not cached; they surface an error and return neutral.
+    """
+    fast = keyword_emotion(text)
+    if fast is not None:
+        return fast
+
+    classifier = load_local_emotion_detector()
+    model_key = EMOTION_MODEL_ID if classifier is not None else require_gemini()[0]
+    try:
+        return _classify_entry(model_key, text)
+    except Exception as e:
+        st.error(f"Emotion detection error: {str(e)}")
+        return "neutral", 0.5
+
+def analyze_entry(text):
+    """Emotion detection plus supportive response for a freshly saved entry.
+
+    With the local classifier, emotion is computed on-CPU and only the
+    supportive response goes to Gemini. On the Gemini-only path a single
+    merged call returns both fields as JSON, so one round trip covers
+    the whole save.
+
+    Returns (emotion, confidence, support); support is an iterable of
+    text chunks suitable for st.write_stream, or None if the support
+    call failed. On the local path the Gemini response is streamed, so
+    the first words appear before the generation finishes.
+    """
+    support_prompt = SUPPORT_TMPL.format_map({'text': text[:300]})
+
+    classifier = load_local_emotion_detector()
+    if classifier is not None:
+        # Emotion needs no network here, so a Gemini outage must not
+        # block the save; the support stream degrades to the canned
+        # fallback message instead
+        emotion, confidence = detect_emotion(text)
+        try:
+            _, model = get_gemini_model()
+            stream = model.generate_content(support_prompt, stream=True)
+            support = _safe_stream(stream)
+        except Exception:
+            support = None
+        return emotion, confidence, support
+
+    # Gemini-only path: one merged call returns both the emotion and the
+    # supportive reply, halving the round trips per save. An unavailable
+    # model raises here so the page shows the real reason rather than
+    # st.stop()'s StopException vanishing into a broad except.
+    merged_prompt = ANALYZE_TMPL.format_map({'text': text[:ANALYSIS_CHAR_LIMIT]})
+    _, model = get_gemini_model()
+
+    try:
+        raw = model.generate_content(merged_prompt).text
+    except Exception:
+        return "neutral", 0.5, None
+
+    emotion, confidence, support_text = _parse_merged_analysis(raw)
+    support = None if support_text is None else iter([support_text])
+    return emotion, confidence, support
+
+def _safe_stream(stream):
+    """Yield the text of each streamed chunk, swallowing failures.
+
+    Consumption happens in st.write_stream, after the entry is already
+    saved; a connection dropped mid-stream or a safety-blocked candidate
+    (chunk.text raises) must not turn into a page error. The generator
+    just stops instead, and the page falls back to the canned message
+    when nothing arrived.
+    """
+    try:
+        for chunk in stream:
+            yield chunk.text
+    except Exception:
+        return
+
+def _parse_merged_analysis(raw):
+    """Extract {emotion, response} from the merged Gemini reply.
+
+    Tolerates code-fence wrapping by falling back to the first {...}
+    block in the text. Returns (emotion, confidence, support_text);
+    unparseable replies come back neutral with low confidence.
+    """
+    data = None
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        match = re.search(r"\{.*\}", raw, re.DOTALL)
+        if match is not None:
+            try:
+                data = json.loads(match.group(0))
+            except ValueError:
+                data = None
+    if not isinstance(data, dict):
+        return "neutral", 0.5, None
+
+    emotion = _normalize_emotion(str(data.get('emotion', '')))
+    support_text = data.get('response') or None
+    return emotion, 0.85, support_text
+
+def score_entries(texts, batch_size=16):
+    """Classify a list of entry texts, batching through the local model.
+
+    Texts are bucketed by length before batching so padding waste within
+    each batch stays small; results come back in the original order. On
+    the Gemini fallback the per-entry calls are independent, so they are
+    fired concurrently with asyncio.gather instead of serially.
+    """
+    classifier = load_local_emotion_detector()
+    if classifier is None:
+        _, model = require_gemini()
+
+        async def _score_all():
+            return await asyncio.gather(
+                *(model.generate_content_async(_emotion_prompt(t)) for t in texts),
+                return_exceptions=True,
+            )
+
+        results = []
+        for response in asyncio.run(_score_all()):
+            if isinstance(response, Exception):
+                results.append(("neutral", 0.5))
+                continue
+            results.append((_normalize_emotion(response.text), 0.85))
+        return results
+
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    results = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        batch = classifier([texts[i] for i in indices])
+        for i, result in zip(indices, batch):
+            results[i] = (_normalize_emotion(result['label']), result['score'])
+    return results
+
+# PAGE 1: Journal Entry
+@st.fragment
+def journal_entry_page():
+    st.header("Write Your Thoughts")
+    st.write("This is a safe, private space. Write freely about what's on your mind.")
+    
+    user_entry = st.text_area(
+        "What's on your mind?",
+        height=200,
+        placeholder="Take your time... express whatever you're feeling..."
+    )
+    text = user_entry.strip()
+    if len(text) > ANALYSIS_CHAR_LIMIT:
+        st.caption(
+            f"Only the first {ANALYSIS_CHAR_LIMIT} characters are analyzed; "
+            "the full entry is saved."
+        )
+
+    col1, col2 = st.columns([1, 3])
+
+    with col1:
+        if st.button("💾 Save Entry", type="primary"):
+            if text:
+                with st.spinner("🔍 Analyzing your entry..."):
+                    try:
+                        emotion, confidence, support = analyze_entry(text)
+
+                        # Save entry
+                        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                        entry_data = {
+                            'timestamp': timestamp,
+                            'text': text,
+                            'emotion': emotion,
+                            'confidence': confidence
+                        }
+                        add_entry(entry_data)
+
+                        # Success message
+                        st.success("✅ Entry saved!")
+                        
+                        # Show emotion
+                        st.info(f"**Detected emotion:** {emotion.capitalize()}")
+                        st.progress(confidence)
+                        st.caption(f"Confidence: {confidence:.1%}")
+                        
+                        # Show the supportive response as it arrives; a
+                        # stream that dies before yielding anything falls
+                        # back to the canned message
+                        st.write("💙 **Response:**")
+                        streamed = st.write_stream(support) if support is not None else ""
+                        if not streamed:
+                            # Fallback supportive messages
+                            message = SUPPORTIVE_MESSAGES.get(emotion, "💙 Thank you for sharing.")
+                            st.write(message)
+                    
+                    except Exception as e:
+                        st.error(f"An error occurred: {str(e)}")
+                        
+            else:
+                st.warning("⚠️ Please write something first")
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def generate_prompt(topic, seed):
+    """One Gemini journaling prompt per (topic, seed).
+
+    With seven fixed topics, repeated clicks for the same topic within
+    the TTL are cache hits; bumping the seed (Regenerate) deliberately
+    bypasses the cache for fresh variety.
+    """
+    prompt_request = PROMPT_REQUEST_TMPL.format_map({'topic': topic.lower(), 'seed': seed})
+
+    _, model = require_gemini()
+    return model.generate_content(prompt_request).text
+
+# PAGE 2: Get Journaling Prompt
+@st.fragment
+def get_prompt_page():
+    st.header("Get a Journaling Prompt")
+    st.write("Need inspiration? Generate a thoughtful prompt to guide your journaling.")
+
+    topic = st.selectbox(
+        "Choose a focus area:",
+        ["General Reflection", "Stress & Anxiety", "Gratitude",
+         "Self-Compassion", "Relationships", "Personal Growth", "Emotions"]
+    )
+
+    if 'prompt_seed' not in st.session_state:
+        st.session_state.prompt_seed = 0
+
+    col1, col2 = st.columns([1, 1])
+    generate_clicked = col1.button("✨ Generate Prompt", type="primary")
+    regenerate_clicked = col2.button("🔄 Regenerate")
+
+    if regenerate_clicked:
+        st.session_state.prompt_seed += 1
+
+    if generate_clicked or regenerate_clicked:
+        with st.spinner("🤔 Creating your prompt..."):
+            try:
+                st.session_state.prompt_text = generate_prompt(
+                    topic, st.session_state.prompt_seed
+                )
+            except Exception:
+                # Fallback prompt bank - no model call needed
+                st.session_state.prompt_text = random.choice(PROMPT_VARIANTS[topic])
+
+    prompt_text = st.session_state.get('prompt_text')
+    if prompt_text:
+        st.write("### 💭 Your Journaling Prompt:")
+        st.info(prompt_text)
+
+        st.write("---")
+        st.write("**Ready to write?** Use the space below:")
+
+        quick_entry = st.text_area("Your response:", height=150, key="quick_journal")
+
+        if st.button("Save This Entry"):
+            quick_text = quick_entry.strip()
+            if quick_text:
+                with st.spinner("Analyzing..."):
+                    emotion, confidence = detect_emotion(quick_text)
+
+                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    entry_data = {
+                        'timestamp': timestamp,
+                        'text': f"Prompt: {prompt_text}\n\nResponse: {quick_text}",
+                        'emotion': emotion,
+                        'confidence': confidence
+                    }
+                    add_entry(entry_data)
+                    st.success("✅ Entry saved!")
+            else:
+                st.warning("⚠️ Please write something first")
+
+# PAGE 3: Therapy Prep
+@st.fragment
+def therapy_prep_page():
+    st.header("Therapy Session Preparation")
+    st.write("Review your journal entries and identify patterns to discuss in therapy.")
+    
+    if entry_count() == 0:
+        st.info("📝 No journal entries yet. Start journaling to generate insights for therapy!")
+    else:
+        st.write(f"**Total entries:** {total_entries()}")
+        
+        # Emotion distribution
+        st.write("### 📊 Your Emotional Patterns")
+        emotion_counts = emotion_stats(
+            entry_count(), st.session_state.entries['timestamp'][-1]
+        )
+        total = sum(emotion_counts.values())
+
+        # Display as a simple chart
+        for emotion, count in emotion_counts.most_common():
+            percentage = (count / total) * 100
+            st.write(f"**{emotion.capitalize()}**: {count} entries ({percentage:.1f}%)")
+            st.progress(percentage / 100)
+        
+        if st.button("🔁 Re-analyze all entries"):
+            with st.spinner("Re-scoring your entries..."):
+                conn = get_db()
+                rows = conn.execute(
+                    "SELECT rowid, text FROM entries ORDER BY ts"
+                ).fetchall()
+                for (rowid, text), (emotion, confidence) in zip(
+                    rows, score_entries([text for _, text in rows])
+                ):
+                    conn.execute(
+                        "UPDATE entries SET emotion = ?, confidence = ? WHERE rowid = ?",
+                        (emotion, confidence, rowid)
+                    )
+                conn.commit()
+                emotion_stats.clear()
+                del st.session_state['entries']
+                st.success("✅ All entries re-analyzed!")
+                st.rerun()
+
+        st.write("---")
+
+        # AI-generated therapy prep
+        st.write("### 🤖 AI-Generated Therapy Prep Summary")
+        
+        if st.button("Generate Therapy Summary", type="primary"):
+            with st.spinner("📊 Analyzing your journal entries..."):
+                try:
+                    # Compile recent entries; the LIMIT/substr happen in
+                    # SQLite so only ten trimmed rows cross into Python,
+                    # and compact JSON keeps the prompt token count down
+                    recent = get_db().execute(
+                        "SELECT ts, emotion, substr(text, 1, 400) FROM entries "
+                        "ORDER BY ts DESC LIMIT 10"
+                    ).fetchall()[::-1]
+                    entries_payload = json.dumps(
+                        [{'t': ts, 'e': emotion, 'x': text} for ts, emotion, text in recent],
+                        separators=(',', ':')
+                    )
+
+                    summary_prompt = SUMMARY_TMPL.format_map({'entries': entries_payload})
+
+                    # Raises with a real message into the except below;
+                    # require_gemini's st.stop() would be swallowed by it
+                    _, model = get_gemini_model()
+                    stream = model.generate_content(summary_prompt, stream=True)
+                    summary_text = st.write_stream(chunk.text for chunk in stream)
+
+                    # Export option
+                    st.write("---")
+                    # Same full-database stats as the chart above, so the
+                    # downloaded file matches what the page displays
+                    full_summary = "\n".join([
+                        "THERAPY SESSION PREP SUMMARY",
+                        f"Generated: {today_str('%Y-%m-%d')}",
+                        "",
+                        summary_text,
+                        "",
+                        "EMOTIONAL DISTRIBUTION:",
+                        *(
+                            f"- {emotion.capitalize()}: {count} entries ({count / total * 100:.1f}%)"
+                            for emotion, count in emotion_counts.most_common()
+                        ),
+                        "",
+                    ])
+                    
+                    st.download_button(
+                        "📄 Download Summary",
+                        data=full_summary,
+                        file_name=f"therapy_prep_{today_str('%Y%m%d')}.txt",
+                        mime="text/plain"
+                    )
+                
+                except Exception as e:
+                    st.error(f"Error generating summary: {str(e)}")
+
+# PAGE 4: View History
+@st.fragment
+def view_history_page():
+    st.header("Your Journal History")
+    
+    total = total_entries()
+    if total == 0:
+        st.info("📝 No entries yet. Start journaling to see your history here!")
+    else:
+        st.write(f"**Total entries:** {total}")
+
+        # Filter options and counts come from the full-database stats,
+        # not the capped in-memory window, so every entry stays reachable
+        emotion_counts = emotion_stats(
+            entry_count(), st.session_state.entries['timestamp'][-1]
+        )
+        filter_emotion = st.selectbox(
+            "Filter by emotion:", ["All"] + sorted(emotion_counts)
+        )
+
+        if filter_emotion == "All":
+            matching, where, params = total, "", ()
+        else:
+            matching = emotion_counts[filter_emotion]
+            where, params = "WHERE emotion = ? ", (filter_emotion,)
+
+        st.write(f"Showing {matching} entries")
+
+        # Paginate in SQL: only the visible rows cross into Python, and
+        # the emotion filter rides idx_entries_emotion
+        page_size = 20
+        total_pages = max(1, math.ceil(matching / page_size))
+        page_num = st.number_input("Page", min_value=1, max_value=total_pages, value=1)
+        rows = get_db().execute(
+            "SELECT ts, text, emotion, confidence FROM entries "
+            + where + "ORDER BY ts DESC LIMIT ? OFFSET ?",
+            params + (page_size, (page_num - 1) * page_size)
+        )
+        for ts, text, emotion, confidence in rows:
+            with st.expander(f"📅 {ts} - {emotion.capitalize()}"):
+                st.write(text)
+                st.caption(f"Confidence: {confidence:.1%}")
+
+        # Export all
+        st.write("---")
+        if st.button("📥 Export All Entries"):
+            parts = []
+            for ts, text, emotion, confidence in get_db().execute(
+                "SELECT ts, text, emotion, confidence FROM entries ORDER BY ts"
+            ):
+                parts.append(f"\n{'='*60}\n")
+                parts.append(f"Date: {ts}\n")
+                parts.append(f"Emotion: {emotion} (confidence: {confidence:.1%})\n")
+                parts.append(f"\n{text}\n")
+            export_text = "".join(parts)
+
+            st.download_button(
+                "💾 Download Complete Journal",
+                data=export_text,
+                file_name=f"complete_journal_{today_str('%Y%m%d')}.txt",
+                mime="text/plain"
+            )
+
+# Page dispatch: each page is a fragment, so widget interactions inside
+# a page rerun only that page's body instead of the whole script
+PAGES: Final = {
+    "📝 Journal Entry": journal_entry_page,
+    "💡 Get Prompt": get_prompt_page,
+    "📊 Therapy Prep": therapy_prep_page,
+    "📖 View History": view_history_page,
+}
+PAGES[page]()
+
+# Sidebar info
+st.sidebar.write("---")
+st.sidebar.write("### 💙 About This App")
+st.sidebar.info("""
+This is a free mental health companion powered by Google Gemini AI.
+
+**Features:**
+- AI emotion detection
+- Personalized journaling prompts
+- Therapy session preparation
+- Secure and private
+""")
+st.sidebar.write(f"**Your entries:** {total_entries()}")
+
+